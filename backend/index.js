@@ -65,7 +65,7 @@ app.use(cors({
   },
   credentials: true,
   // Expose headers needed for file downloads
-  exposedHeaders: ['Content-Disposition']
+  exposedHeaders: ['Content-Disposition', 'X-Mask-Scale']
 }));
 app.use(express.json({ limit: '50mb' })); // Increase limit for base64 image data
 app.use(express.urlencoded({ limit: '50mb', extended: true }));
@@ -261,6 +261,9 @@ app.post('/api/detect-trees', upload.single('image'), async (req, res) => {
 
     console.log('Forwarding request to Python backend...');
 
+    // ?format=mask returns the vegetation mask as a PNG instead of JSON
+    const wantsMask = req.query.format === 'mask';
+
     // Forward to Python FastAPI
     const pythonResponse = await axios.post(
       `${PYTHON_API_URL}/detect-trees`,
@@ -269,12 +272,28 @@ app.post('/api/detect-trees', upload.single('image'), async (req, res) => {
         headers: {
           ...formData.getHeaders()
         },
+        params: wantsMask ? { format: 'mask' } : undefined,
+        responseType: wantsMask ? 'arraybuffer' : 'json',
         maxBodyLength: Infinity,
         maxContentLength: Infinity,
         timeout: 600000 // 10 minutes timeout for large tiles (4951m × 4886m needs ~65s)
       }
     );
 
+    if (wantsMask) {
+      console.log('✅ Python mask successful:', {
+        bytes: pythonResponse.data.byteLength,
+        scale: pythonResponse.headers['x-mask-scale']
+      });
+
+      // Pass the PNG bytes through untouched, with the mask's downsample factor
+      res.set({
+        'Content-Type': 'image/png',
+        'X-Mask-Scale': pythonResponse.headers['x-mask-scale']
+      });
+      return res.send(Buffer.from(pythonResponse.data));
+    }
+
     console.log('✅ Python detection successful:', {
       individualTrees: pythonResponse.data.summary?.individualTreesCount,
       clusters: pythonResponse.data.summary?.treeClustersCount,
@@ -288,7 +307,15 @@ app.post('/api/detect-trees', upload.single('image'), async (req, res) => {
     console.error('❌ Error in tree detection:', error.message);
 
     if (error.response) {
-      // Python returned an error
+      // Python returned an error (raw bytes when a mask was requested)
+      if (Buffer.isBuffer(error.response.data) || error.response.data instanceof ArrayBuffer) {
+        const body = Buffer.from(error.response.data).toString('utf8');
+        try {
+          error.response.data = JSON.parse(body);
+        } catch {
+          error.response.data = { error: body };
+        }
+      }
       console.error('Python error response:', error.response.data);
       res.status(error.response.status).json({
         error: 'Tree detection failed',
@@ -312,6 +339,19 @@ app.post('/api/detect-trees', upload.single('image'), async (req, res) => {
   }
 });
 
+// Collect a (small) streamed error body and parse it as JSON
+async function readJsonStream(stream) {
+  let body = '';
+  for await (const chunk of stream) {
+    body += chunk;
+  }
+  try {
+    return JSON.parse(body);
+  } catch {
+    return { error: body };
+  }
+}
+
 // Phase 3.4 - 3D model generation endpoint (OBJ file download)
 app.post('/api/generate-model', async (req, res) => {
   try {
@@ -331,44 +371,43 @@ app.post('/api/generate-model', async (req, res) => {
       totalPopulated: req.body.summary?.totalPopulatedTrees || 0
     });
 
-    // Forward detection JSON to Python
+    // Forward detection JSON to Python. The OBJ is streamed straight through
+    // to the client so large models (tens of thousands of trees, hundreds of
+    // MB) never have to fit in Node's memory or V8's string length limit.
     const pythonResponse = await axios.post(
       `${PYTHON_API_URL}/generate-model`,
       req.body,  // Send complete detection JSON
       {
+        responseType: 'stream',
         timeout: 300000,  // 5 minutes timeout for large models
         maxBodyLength: Infinity,
         maxContentLength: Infinity
       }
     );
 
-    console.log('✅ Model generated successfully');
-
-    // For very large models (>20k trees), Python saves to Downloads and returns JSON
-    if (pythonResponse.data.filepath) {
-      console.log('Large model saved to Downloads:', pythonResponse.data);
+    console.log('✅ Model generation started, streaming OBJ to client');
 
-      // Return JSON response (model already in Downloads folder)
-      res.json(pythonResponse.data);
-    } else {
-      // Small/medium models - return OBJ content directly
-      res.set({
-        'Content-Type': 'model/obj',
-        'Content-Disposition': 'attachment; filename=trees_model.obj'
-      });
-      res.send(pythonResponse.data);
-    }
+    res.set({
+      'Content-Type': 'model/obj',
+      'Content-Disposition': 'attachment; filename=trees_model.obj'
+    });
+    pythonResponse.data.on('error', (streamError) => {
+      console.error('❌ Model stream error:', streamError.message);
+      res.destroy(streamError);
+    });
+    pythonResponse.data.pipe(res);
 
   } catch (error) {
     console.error('❌ Model generation error:', error.message);
 
     if (error.response && error.response.data) {
-      // Python returned an error
-      console.error('Python error response:', error.response.data);
+      // Python returned an error (body arrives as a stream, read it as JSON)
+      const pythonError = await readJsonStream(error.response.data);
+      console.error('Python error response:', pythonError);
       res.status(error.response.status).json({
         error: 'Model generation failed',
-        message: error.response.data.detail || error.response.data.error || error.message,
-        pythonError: error.response.data
+        message: pythonError.detail || pythonError.error || error.message,
+        pythonError
       });
     } else if (error.code === 'ECONNREFUSED') {
       // Python backend not running
@@ -378,7 +417,7 @@ app.post('/api/generate-model', async (req, res) => {
         hint: 'Run: cd python_backend && python main.py'
       });
     } else {
-      // Other error (including "string too long" errors)
+      // Other error
       res.status(500).json({
         error: 'Internal server error',
         message: error.message
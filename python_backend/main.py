@@ -3,24 +3,49 @@ FastAPI backend for tree detection and 3D model generation
 Simple, focused on getting data flowing end-to-end
 """
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Body
-from fastapi.responses import JSONResponse, Response
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Body, Query
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 import uvicorn
 import cv2
 import numpy as np
+import io
 import logging
 import os
-from datetime import datetime
-from typing import Optional, Dict, Any
+import threading
+from typing import Optional, Dict, Any, Literal, Tuple
+from PIL import Image
 
-from tree_detector_core import detect_trees_in_image
-from model_generator_core import generate_obj_content, generate_model_metadata
+from tree_detector_core import available_cpus, create_tree_mask, detect_trees_in_image, warm_up
+from model_generator_core import generate_obj_chunks, generate_model_metadata
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# =============================================================================
+# JPEG Decoding
+# =============================================================================
+# libjpeg-turbo (via PyTurboJPEG) decodes large satellite JPEGs noticeably
+# faster than cv2.imdecode and can write into a reused buffer. It needs the
+# native libturbojpeg library, so fall back to OpenCV when it isn't available.
+# =============================================================================
+try:
+    from turbojpeg import TurboJPEG
+    _turbo_jpeg = TurboJPEG()
+    logger.info("🚀 Using libjpeg-turbo for JPEG uploads")
+except (ImportError, OSError, RuntimeError):
+    _turbo_jpeg = None
+    logger.info("libjpeg-turbo not available, decoding all uploads with OpenCV")
+
+# Per-thread decode buffer, reused while consecutive uploads have the same size
+_decode_buffers = threading.local()
+
+# EXIF Orientation tag
+_EXIF_ORIENTATION = 0x0112
+
 # =============================================================================
 # CORS Configuration
 # =============================================================================
@@ -35,11 +60,23 @@ ALLOWED_ORIGINS = os.environ.get('ALLOWED_ORIGINS', '*').split(',')
 ALLOWED_ORIGINS = [origin.strip() for origin in ALLOWED_ORIGINS]
 logger.info(f"🔒 CORS allowed origins: {ALLOWED_ORIGINS}")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Per-worker startup: load the compiled cluster kernel before serving."""
+    await run_in_threadpool(warm_up)
+    logger.info("🔥 Cluster kernel ready")
+    yield
+
+
 # Create FastAPI app
 app = FastAPI(
     title="Tree Detection API",
     description="Backend API for detecting trees in satellite imagery using HSV color filtering",
-    version="1.0.0"
+    version="1.0.0",
+    # orjson serializes the large detection payloads (and NumPy arrays in
+    # them) much faster than the stdlib json encoder
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -51,9 +88,119 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Mask-Scale"],  # read by ?format=mask clients
 )
 
 
+def jpeg_orientation(contents: bytes) -> int:
+    """
+    Read the EXIF orientation of a JPEG (1 = upright, also when untagged).
+    
+    Pillow only parses the header segments here, nothing is decompressed.
+    """
+    try:
+        with Image.open(io.BytesIO(contents)) as im:
+            return int(im.getexif().get(_EXIF_ORIENTATION, 1))
+    except Exception:
+        return 1
+
+
+def decode_image(contents: bytes) -> Optional[np.ndarray]:
+    """
+    Decode uploaded image bytes into an OpenCV BGR image.
+    
+    JPEGs go through libjpeg-turbo into a reused per-thread buffer when
+    available; everything else (and any JPEG it rejects) uses cv2.imdecode.
+    libjpeg-turbo ignores EXIF orientation while cv2.imdecode applies it, so
+    rotated/flipped JPEGs also go to OpenCV to keep pixel coordinates aligned
+    with the real-world dimensions.
+    
+    Returns:
+        BGR image, or None if the data could not be decoded
+    """
+    if _turbo_jpeg is not None and contents[:2] == b"\xff\xd8" and jpeg_orientation(contents) == 1:
+        try:
+            width, height, _, _ = _turbo_jpeg.decode_header(contents)
+            buffer = getattr(_decode_buffers, "bgr", None)
+            if buffer is None or buffer.shape != (height, width, 3):
+                buffer = np.empty((height, width, 3), np.uint8)
+                _decode_buffers.bgr = buffer
+            return _turbo_jpeg.decode(contents, dst=buffer)
+        except (OSError, ValueError) as e:
+            logger.warning(f"libjpeg-turbo failed to decode upload, falling back to OpenCV: {e}")
+    
+    nparr = np.frombuffer(contents, np.uint8)
+    return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+
+def decode_upload(contents: bytes) -> np.ndarray:
+    """Decode an uploaded image, raising a 400 if it isn't a readable image."""
+    img = decode_image(contents)
+    
+    if img is None:
+        logger.error("Failed to decode image")
+        raise HTTPException(
+            status_code=400,
+            detail="Failed to decode image. Please ensure the file is a valid image format (PNG, JPG, etc.)"
+        )
+    
+    logger.info(f"Image decoded successfully: {img.shape[1]}×{img.shape[0]} pixels")
+    return img
+
+
+def run_detection(
+    contents: bytes,
+    hsv_thresholds: Dict[str, Dict[str, int]],
+    detection_params: Dict[str, float],
+    real_dimensions: Dict[str, float]
+) -> Dict[str, Any]:
+    """
+    Blocking part of /detect-trees: decode the upload and run detection.
+    
+    Runs on a threadpool worker. Decoding happens here too (not on the event
+    loop) because decode_image reuses a per-thread buffer that must not be
+    overwritten while another request is still detecting on it.
+    """
+    img = decode_upload(contents)
+    
+    # Call core detection function
+    logger.info("Starting tree detection...")
+    return detect_trees_in_image(
+        img,
+        hsv_thresholds,
+        detection_params,
+        real_dimensions
+    )
+
+
+def run_mask(
+    contents: bytes,
+    hsv_thresholds: Dict[str, Dict[str, int]],
+    detection_params: Dict[str, float],
+    real_dimensions: Dict[str, float]
+) -> Tuple[bytes, int]:
+    """
+    Blocking part of /detect-trees?format=mask: decode, build the mask, encode PNG.
+    
+    Encoding happens on the same worker as well, since the mask is a
+    per-thread scratch buffer.
+    
+    Returns:
+        Tuple of (PNG bytes, downsample factor of the mask vs. the upload)
+    """
+    img = decode_upload(contents)
+    
+    logger.info("Building vegetation mask...")
+    mask, scale = create_tree_mask(img, hsv_thresholds, detection_params, real_dimensions)
+    
+    # Fastest zlib level: masks are mostly flat runs, so higher levels buy
+    # little size for a lot of CPU
+    ok, png = cv2.imencode(".png", mask, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+    if not ok:
+        raise RuntimeError("Failed to encode mask as PNG")
+    return png.tobytes(), scale
+
+
 @app.get("/")
 def root():
     """Root endpoint with API info"""
@@ -92,7 +239,12 @@ async def detect_trees(
     max_diameter: float = Form(..., description="Maximum tree diameter in meters"),
     cluster_threshold: float = Form(..., description="Cluster threshold diameter in meters"),
     real_width: float = Form(..., description="Real-world width in meters"),
-    real_height: float = Form(..., description="Real-world height in meters")
+    real_height: float = Form(..., description="Real-world height in meters"),
+    return_format: Literal["json", "mask"] = Query(
+        "json",
+        alias="format",
+        description="'json' for detection results, 'mask' for the binary vegetation mask as PNG"
+    )
 ):
     """
     Detect trees in a satellite image using HSV color thresholding.
@@ -102,6 +254,13 @@ async def detect_trees(
     2. Applies HSV filtering to identify vegetation
     3. Detects individual trees and tree clusters
     4. Returns tree positions and metadata
+    
+    With ?format=mask the contour/cluster stages are skipped and the binary
+    vegetation mask is returned as a PNG instead. The mask is at working
+    resolution (fine imagery is downsampled, see create_tree_mask): the
+    X-Mask-Scale header gives the factor, so mask pixel (x, y) covers upload
+    pixels x*scale .. x*scale + scale - 1. It has already been
+    morphologically opened.
     """
     try:
         logger.info(f"Received detection request for image: {image.filename}")
@@ -109,20 +268,6 @@ async def detect_trees(
         logger.info(f"Detection params: diameter({min_diameter}-{max_diameter}m), cluster({cluster_threshold}m)")
         logger.info(f"Real dimensions: {real_width}m × {real_height}m")
         
-        # Read image from upload
-        contents = await image.read()
-        nparr = np.frombuffer(contents, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
-        if img is None:
-            logger.error("Failed to decode image")
-            raise HTTPException(
-                status_code=400,
-                detail="Failed to decode image. Please ensure the file is a valid image format (PNG, JPG, etc.)"
-            )
-        
-        logger.info(f"Image decoded successfully: {img.shape[1]}×{img.shape[0]} pixels")
-        
         # Prepare parameters for detection function
         hsv_thresholds = {
             "hue": {"min": hue_min, "max": hue_max},
@@ -141,10 +286,29 @@ async def detect_trees(
             "height": real_height
         }
         
-        # Call core detection function
-        logger.info("Starting tree detection...")
-        result = detect_trees_in_image(
-            img,
+        # Read image from upload
+        contents = await image.read()
+        
+        if return_format == "mask":
+            png, scale = await run_in_threadpool(
+                run_mask,
+                contents,
+                hsv_thresholds,
+                detection_params,
+                real_dimensions
+            )
+            logger.info(f"Mask complete: {len(png)} bytes, scale 1/{scale}")
+            return Response(
+                content=png,
+                media_type="image/png",
+                headers={"X-Mask-Scale": str(scale)}
+            )
+        
+        # Decode + detect on the threadpool so the event loop stays free for
+        # other uploads while OpenCV/NumPy do the heavy lifting
+        result = await run_in_threadpool(
+            run_detection,
+            contents,
             hsv_thresholds,
             detection_params,
             real_dimensions
@@ -154,8 +318,8 @@ async def detect_trees(
                    f"{result['summary']['treeClustersCount']} clusters, "
                    f"{result['summary']['totalPopulatedTrees']} populated trees")
         
-        return JSONResponse(content=result)
-        
+        return ORJSONResponse(content=result)
+    
     except HTTPException:
         raise
     except Exception as e:
@@ -175,8 +339,7 @@ async def generate_model(detection_data: Dict[str, Any] = Body(...)):
         detection_data: Complete tree detection JSON from /detect-trees endpoint
     
     Returns:
-        For small models: OBJ file content as plain text
-        For large models: Saves to Downloads folder and returns filepath
+        OBJ file content streamed as plain text
     """
     try:
         logger.info("Received 3D model generation request")
@@ -204,50 +367,22 @@ async def generate_model(detection_data: Dict[str, Any] = Body(...)):
                        f"Current: {total_trees:,} trees. Recommended: <60,000 trees."
             )
         
-        # For large models (>20k trees), save to Downloads folder
-        if total_trees > 20000:
-            logger.info(f"Large model detected ({total_trees} trees), saving to Downloads folder...")
-            
-            # Generate OBJ content
-            obj_content, mtl_content = generate_obj_content(detection_data)
-            
-            # Save to Downloads folder (Windows)
-            downloads_dir = os.path.join(os.path.expanduser("~"), "Downloads")
-            os.makedirs(downloads_dir, exist_ok=True)
-            
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            obj_filename = f"trees_model_{total_trees}trees_{timestamp}.obj"
-            obj_filepath = os.path.join(downloads_dir, obj_filename)
-            
-            with open(obj_filepath, 'w') as f:
-                f.write(obj_content)
-            
-            file_size_mb = os.path.getsize(obj_filepath) / (1024 * 1024)
-            logger.info(f"Model saved to {obj_filepath} ({file_size_mb:.2f} MB)")
-            
-            # Return filepath for Express to stream
-            return {
-                "filepath": os.path.abspath(obj_filepath),
-                "filename": obj_filename,
-                "filesize_mb": round(file_size_mb, 2),
-                "total_trees": total_trees,
-                "message": f"Model saved to Downloads folder ({file_size_mb:.1f}MB)"
-            }
-        else:
-            # Small/medium models - return content directly
-            obj_content, mtl_content = generate_obj_content(detection_data)
-            
-            logger.info("Model generation complete")
-            
-            # Return OBJ content with proper headers for download
-            return Response(
-                content=obj_content,
-                media_type="model/obj",
-                headers={
-                    "Content-Disposition": f"attachment; filename=trees_model.obj"
-                }
-            )
+        # Stream the OBJ one tree at a time instead of building the whole file
+        # in memory (the base model is loaded up front, so a missing model
+        # still raises FileNotFoundError before the response starts)
+        obj_chunks = generate_obj_chunks(detection_data)
         
+        logger.info("Streaming model to client")
+        
+        # Return OBJ content with proper headers for download
+        return StreamingResponse(
+            obj_chunks,
+            media_type="model/obj",
+            headers={
+                "Content-Disposition": f"attachment; filename=trees_model.obj"
+            }
+        )
+    
     except HTTPException:
         raise
     except FileNotFoundError as e:
@@ -269,10 +404,21 @@ if __name__ == "__main__":
     logger.info("Server will be available at: http://localhost:5001")
     logger.info("API documentation at: http://localhost:5001/docs")
     
+    # Multiple worker processes give real parallelism across requests;
+    # workers > 1 requires the "module:app" import string, not the app object.
+    # Defaults to the CPUs this process may use; containers should set
+    # WEB_CONCURRENCY since a CPU quota isn't visible from inside
+    workers = int(os.environ.get("WEB_CONCURRENCY", available_cpus()))
+    logger.info(f"Starting {workers} worker process(es)")
+    
+    # Spawned workers inherit the environment: export the real count so each
+    # sizes its cluster-population pool to its share of the CPUs
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    
     uvicorn.run(
-        app,
+        "main:app",
         host="0.0.0.0",
         port=5001,
         log_level="info",
-        #workers=4
+        workers=workers
     )
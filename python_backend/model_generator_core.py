@@ -4,7 +4,7 @@ Extracted from json_to_3d_model.py without GUI dependencies
 """
 
 import os
-from typing import Dict, List, Any, Tuple
+from typing import Any, Dict, Iterator, List, Tuple
 from datetime import datetime
 
 
@@ -81,13 +81,18 @@ def extract_trees_from_detection(detection_data: Dict[str, Any]) -> List[Dict[st
     return all_trees
 
 
-def generate_obj_content(
+def generate_obj_chunks(
     detection_data: Dict[str, Any],
     base_tree_height: float = 5.0,
     model_path: str = "tree_model/Henkel_tree.obj"
-) -> Tuple[str, str]:
+) -> Iterator[str]:
     """
-    Generate OBJ and MTL file contents from detection data.
+    Generate OBJ file content from detection data as a sequence of text chunks.
+    
+    The header is one chunk and every tree is one chunk, so only a single
+    tree's worth of text is held in memory at a time. The base tree model is
+    loaded before the first chunk is produced, so a missing model file raises
+    FileNotFoundError here rather than halfway through a stream.
     
     Args:
         detection_data: Tree detection JSON
@@ -95,11 +100,21 @@ def generate_obj_content(
         model_path: Path to base tree model
     
     Returns:
-        Tuple of (obj_content, mtl_content)
+        Iterator of OBJ text chunks
     """
     # Load base tree model
-    tree_vertices, tree_faces, tree_normals = load_tree_model(model_path)
+    tree_vertices, tree_faces, _ = load_tree_model(model_path)
     
+    return _iter_obj_chunks(detection_data, tree_vertices, tree_faces, base_tree_height)
+
+
+def _iter_obj_chunks(
+    detection_data: Dict[str, Any],
+    tree_vertices: List,
+    tree_faces: List,
+    base_tree_height: float
+) -> Iterator[str]:
+    """Yield the OBJ header followed by one chunk per tree."""
     # Extract metadata
     metadata = detection_data.get('metadata', {})
     real_dims = metadata.get('realDimensionsM', {})
@@ -113,28 +128,31 @@ def generate_obj_content(
     tile_center_x = tile_width / 2
     tile_center_z = tile_height / 2
     
-    # Generate OBJ content
-    obj_lines = []
-    obj_lines.append("# Generated by Forma Tree Detection")
-    obj_lines.append(f"# Generated: {datetime.now().isoformat()}")
-    obj_lines.append(f"# Trees: {len(trees)}")
-    obj_lines.append(f"# Tile size: {tile_width:.2f}m × {tile_height:.2f}m")
-    obj_lines.append(f"# Origin: Center of tile ({tile_center_x:.2f}, {tile_center_z:.2f})")
-    obj_lines.append("mtllib trees_model.mtl\n")
-    
-    vertex_offset = 1  # OBJ indices start at 1
+    # OBJ header
+    header_lines = []
+    header_lines.append("# Generated by Forma Tree Detection")
+    header_lines.append(f"# Generated: {datetime.now().isoformat()}")
+    header_lines.append(f"# Trees: {len(trees)}")
+    header_lines.append(f"# Tile size: {tile_width:.2f}m × {tile_height:.2f}m")
+    header_lines.append(f"# Origin: Center of tile ({tile_center_x:.2f}, {tile_center_z:.2f})")
+    header_lines.append("mtllib trees_model.mtl\n")
     
     # === Trees ===
-    obj_lines.append("# Trees")
-    obj_lines.append("usemtl tree_material\n")
+    header_lines.append("# Trees")
+    header_lines.append("usemtl tree_material\n")
+    yield "\n".join(header_lines) + "\n"
+    
+    vertex_offset = 1  # OBJ indices start at 1
     
     for i, tree in enumerate(trees):
+        tree_lines = []
+        
         # Calculate tree height and scale
         tree_height = tree['diameter'] * 1.5  # Linear relationship
         scale_factor = tree_height / base_tree_height
         
-        obj_lines.append(f"# Tree {i+1} (diameter: {tree['diameter']:.1f}m, height: {tree_height:.1f}m)")
-        obj_lines.append(f"o Tree_{i+1}")
+        tree_lines.append(f"# Tree {i+1} (diameter: {tree['diameter']:.1f}m, height: {tree_height:.1f}m)")
+        tree_lines.append(f"o Tree_{i+1}")
         
         # Write transformed vertices
         # Apply 90° rotation around X-axis to make Y the vertical axis
@@ -159,30 +177,16 @@ def generate_obj_content(
             y = rotated_y  # Height above ground (what was Z)
             z = rotated_z + ( tile_center_z - tree['y'])  # Direct position, no flip
             
-            obj_lines.append(f"v {x} {y} {z}")
+            tree_lines.append(f"v {x} {y} {z}")
         
         # Write faces (adjust indices)
         for face in tree_faces:
             face_str = " ".join([str(idx + vertex_offset - 1) for idx in face])
-            obj_lines.append(f"f {face_str}")
+            tree_lines.append(f"f {face_str}")
         
         vertex_offset += len(tree_vertices)
-        obj_lines.append("")
-    
-    # Generate MTL content
-    mtl_lines = []
-    mtl_lines.append("# Material file generated by Forma Tree Detection\n")
-    
-    # Tree material (simple green)
-    mtl_lines.append("newmtl tree_material")
-    mtl_lines.append("Ka 0.2 0.5 0.2")  # Ambient color (green)
-    mtl_lines.append("Kd 0.3 0.7 0.3")  # Diffuse color (green)
-    mtl_lines.append("Ks 0.1 0.1 0.1")  # Specular color (slight shine)
-    
-    obj_content = "\n".join(obj_lines)
-    mtl_content = "\n".join(mtl_lines)
-    
-    return obj_content, mtl_content
+        tree_lines.append("")
+        yield "\n".join(tree_lines) + "\n"
 
 
 def generate_model_metadata(detection_data: Dict[str, Any]) -> Dict[str, Any]:
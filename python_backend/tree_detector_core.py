@@ -6,10 +6,190 @@ No GUI dependencies - pure OpenCV processing
 import cv2
 import numpy as np
 import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from numba import njit
 from datetime import datetime
 from typing import Dict, List, Tuple, Any
 
 
+def available_cpus() -> int:
+    """
+    Number of CPUs this process may run on.
+    
+    Uses the scheduler affinity mask where the platform has one (it honours
+    taskset/cpuset limits, unlike os.cpu_count()); note that a container CPU
+    quota (docker --cpus) is not visible here, so set WEB_CONCURRENCY there.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+
+# One cluster-population pool per process, shared by all requests. Each of
+# the WEB_CONCURRENCY worker processes gets its share of the CPUs, so
+# concurrent requests and workers don't multiply the thread count. main.py
+# exports WEB_CONCURRENCY before starting its workers; a process started
+# some other way without it is assumed to be the only worker.
+_CLUSTER_POOL_SIZE = max(1, available_cpus() // max(1, int(os.environ.get("WEB_CONCURRENCY", 1))))
+_CLUSTER_POOL = ThreadPoolExecutor(max_workers=_CLUSTER_POOL_SIZE, thread_name_prefix="populate")
+
+# Fewer clusters than this are populated inline on the request thread
+_MIN_PARALLEL_CLUSTERS = 3
+
+
+# Per-thread scratch buffers reused across requests of the same image size
+_SCRATCH = threading.local()
+
+
+def _get_scratch(height: int, width: int) -> Dict[str, Any]:
+    """
+    Get this thread's working buffers for a (height, width) working image.
+    
+    Buffers are only reallocated when the working image size changes, which
+    avoids tens of MB of malloc/page faults per request on large tiles.
+    Detection results never reference these buffers. create_tree_mask does
+    return the "mask" buffer itself, which stays valid only until the same
+    thread's next detection or mask call.
+    
+    Returns:
+        Dict with "shape", "hsv" (HSV image) and "mask" (uint8); the resized
+        BGR buffer "small" is added by the caller only when downsampling
+    """
+    scratch = getattr(_SCRATCH, "buffers", None)
+    if scratch is None or scratch["shape"] != (height, width):
+        scratch = {
+            "shape": (height, width),
+            "hsv": np.empty((height, width, 3), np.uint8),
+            "mask": np.empty((height, width), np.uint8)
+        }
+        _SCRATCH.buffers = scratch
+    return scratch
+
+
+@lru_cache(maxsize=32)
+def _opening_kernel(size: int) -> np.ndarray:
+    """Elliptical structuring element for mask opening, built once per size."""
+    return cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (size, size))
+
+
+def _hsv_bounds(hsv_thresholds: Dict[str, Dict[str, int]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Lower/upper HSV bounds as uint8 arrays for cv2.inRange."""
+    # Bounds as uint8 to match the HSV image, so inRange takes its native
+    # 8-bit path instead of converting int64 scalars (clipped first, since
+    # out-of-range form values would otherwise overflow).
+    # Note: a wrapping hue range (min > max, e.g. reds) matches nothing here;
+    # it would need two inRange passes (min..179 and 0..max) combined with
+    # cv2.bitwise_or.
+    lower_bound = np.clip([
+        hsv_thresholds["hue"]["min"],
+        hsv_thresholds["saturation"]["min"],
+        hsv_thresholds["value"]["min"]
+    ], 0, 255).astype(np.uint8)
+    upper_bound = np.clip([
+        hsv_thresholds["hue"]["max"],
+        hsv_thresholds["saturation"]["max"],
+        hsv_thresholds["value"]["max"]
+    ], 0, 255).astype(np.uint8)
+    
+    return lower_bound, upper_bound
+
+
+def create_tree_mask(
+    img: np.ndarray,
+    hsv_thresholds: Dict[str, Dict[str, int]],
+    detection_params: Dict[str, float],
+    real_dimensions: Dict[str, float]
+) -> Tuple[np.ndarray, int]:
+    """
+    Build the binary vegetation mask that tree detection works on.
+    
+    The image is downsampled when it is much finer than the smallest tree
+    needs, HSV-thresholded and morphologically opened to remove speckle.
+    
+    Args:
+        img: OpenCV image (BGR format)
+        hsv_thresholds: HSV ranges (see detect_trees_in_image)
+        detection_params: Detection parameters (see detect_trees_in_image)
+        real_dimensions: Real-world size in meters (see detect_trees_in_image)
+    
+    Returns:
+        Tuple of (mask, scale): uint8 mask (255 = vegetation) at working
+        resolution, i.e. image size // scale, and the downsample factor.
+        The mask is a reused per-thread buffer, valid until this thread's
+        next call.
+    """
+    height, width = img.shape[:2]
+    
+    # Calculate meters per pixel
+    meters_per_pixel_x = real_dimensions["width"] / width
+    meters_per_pixel_y = real_dimensions["height"] / height
+    
+    # Minimum tree area in full-resolution pixels
+    min_area_pixels = math.pi * (detection_params["min_diameter"] / 2) ** 2 / (meters_per_pixel_x * meters_per_pixel_y)
+    
+    lower_bound, upper_bound = _hsv_bounds(hsv_thresholds)
+    
+    return _build_mask(
+        img,
+        lower_bound,
+        upper_bound,
+        meters_per_pixel_x,
+        meters_per_pixel_y,
+        detection_params["min_diameter"],
+        min_area_pixels
+    )
+
+
+def _build_mask(
+    img: np.ndarray,
+    lower_bound: np.ndarray,
+    upper_bound: np.ndarray,
+    meters_per_pixel_x: float,
+    meters_per_pixel_y: float,
+    min_diameter: float,
+    min_area_pixels: float
+) -> Tuple[np.ndarray, int]:
+    """Mask pipeline behind create_tree_mask, taking already-derived inputs."""
+    height, width = img.shape[:2]
+    
+    # Downsample very fine imagery: the smallest tree only needs ~8 px across
+    # to be detected, so extra resolution just costs memory bandwidth.
+    # Contours are scaled back to full-resolution pixels after findContours.
+    target_meters_per_pixel = min_diameter / 8.0
+    scale = max(1, int(target_meters_per_pixel / max(meters_per_pixel_x, meters_per_pixel_y)))
+    scale = min(scale, width, height)  # never shrink below 1 px
+    work_height, work_width = height // scale, width // scale
+    scratch = _get_scratch(work_height, work_width)
+    if scale > 1:
+        if "small" not in scratch:
+            scratch["small"] = np.empty((work_height, work_width, 3), np.uint8)
+        work_img = scratch["small"]
+        cv2.resize(img, (work_width, work_height), dst=work_img, interpolation=cv2.INTER_AREA)
+    else:
+        work_img = img
+    
+    # Create HSV mask (OpenCV writes into reused per-thread buffers instead of
+    # allocating fresh ones for the conversion and the threshold)
+    hsv = scratch["hsv"]
+    cv2.cvtColor(work_img, cv2.COLOR_BGR2HSV, dst=hsv)
+    
+    mask = scratch["mask"]
+    cv2.inRange(hsv, lower_bound, upper_bound, dst=mask)
+    
+    # Morphological opening removes most sub-threshold speckle before
+    # labelling/contour tracing. Kernel (odd, >= 3) is about a third of the
+    # smallest tree's width in working-resolution pixels, so real trees survive.
+    min_area_work_pixels = min_area_pixels / (scale * scale)
+    kernel_size = max(3, int(math.sqrt(min_area_work_pixels) / 3) | 1)
+    kernel = _opening_kernel(kernel_size)
+    cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, dst=mask)
+    
+    return mask, scale
+
+
 def detect_trees_in_image(
     img: np.ndarray,
     hsv_thresholds: Dict[str, Dict[str, int]],
@@ -40,7 +220,11 @@ def detect_trees_in_image(
             }
     
     Returns:
-        Dictionary with detection results matching frontend TypeScript types
+        Dictionary with detection results matching frontend TypeScript types.
+        Polygons are returned in pixels only (metadata.pixelToMeter converts
+        them to meters): cluster outlines as NumPy arrays, so serialize with
+        orjson (OPT_SERIALIZE_NUMPY, as used by ORJSONResponse), and
+        individual trees as their bounding box.
     """
     height, width = img.shape[:2]
     
@@ -48,107 +232,147 @@ def detect_trees_in_image(
     meters_per_pixel_x = real_dimensions["width"] / width
     meters_per_pixel_y = real_dimensions["height"] / height
     
-    # Create HSV mask
-    hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
+    # Scale factors as plain floats so NumPy broadcasts them over whole arrays
+    mx = float(meters_per_pixel_x)
+    my = float(meters_per_pixel_y)
     
-    lower_bound = np.array([
-        hsv_thresholds["hue"]["min"],
-        hsv_thresholds["saturation"]["min"],
-        hsv_thresholds["value"]["min"]
-    ])
-    upper_bound = np.array([
-        hsv_thresholds["hue"]["max"],
-        hsv_thresholds["saturation"]["max"],
-        hsv_thresholds["value"]["max"]
-    ])
+    # Size thresholds, precomputed once as full-resolution pixel areas so
+    # blobs are classified by comparing pixel counts directly
+    px_to_m2 = meters_per_pixel_x * meters_per_pixel_y
+    min_area_pixels = math.pi * (detection_params["min_diameter"] / 2) ** 2 / px_to_m2
+    max_area_pixels = math.pi * (detection_params["max_diameter"] / 2) ** 2 / px_to_m2
+    cluster_area_pixels = math.pi * (detection_params["cluster_threshold"] / 2) ** 2 / px_to_m2
+    
+    # HSV mask of vegetation (downsampled and speckle-filtered)
+    lower_bound, upper_bound = _hsv_bounds(hsv_thresholds)
+    mask, scale = _build_mask(
+        img,
+        lower_bound,
+        upper_bound,
+        meters_per_pixel_x,
+        meters_per_pixel_y,
+        detection_params["min_diameter"],
+        min_area_pixels
+    )
+    
+    # Label connected blobs: areas and centroids for every component come
+    # back from a single C pass instead of contourArea/moments per contour
+    _, labels, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8, ltype=cv2.CV_32S)
     
-    mask = cv2.inRange(hsv, lower_bound, upper_bound)
+    # Component areas in full-resolution pixels. Classify every blob in one
+    # vectorized pass: tiny noise is dropped, blobs above the cluster
+    # threshold are clusters, and the rest are individual trees only if they
+    # are within the min/max diameter range (label 0 is the background).
+    areas_px = stats[:, cv2.CC_STAT_AREA].astype(np.float64) * (scale * scale)
+    large_enough = areas_px >= min_area_pixels
+    large_enough[0] = False
+    is_cluster = large_enough & (areas_px > cluster_area_pixels)
+    is_individual = large_enough & ~is_cluster & (areas_px <= max_area_pixels)
+    kept_labels = np.flatnonzero(is_cluster | is_individual)
     
-    # Find contours (tree polygons)
-    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    # Convert to real-world area and estimated diameter, for accepted blobs only
+    areas_m2 = areas_px[kept_labels] * px_to_m2
+    diameters_m = 2 * np.sqrt(areas_m2 / math.pi)
     
-    # Calculate minimum area threshold
-    min_diameter_m = detection_params["min_diameter"]
-    min_radius_m = min_diameter_m / 2
-    min_area_m2 = math.pi * (min_radius_m ** 2)
-    min_area_pixels = min_area_m2 / (meters_per_pixel_x * meters_per_pixel_y)
+    # Get centroids (full-resolution pixels). A working pixel i covers full
+    # pixels i*scale .. i*scale + scale - 1, so map pixel centres to centres
+    # rather than to the block's top-left corner.
+    centroids_px = np.rint((centroids[kept_labels] + 0.5) * scale - 0.5).astype(np.int64)
     
-    # Calculate cluster threshold
-    cluster_diameter_m = detection_params["cluster_threshold"]
-    cluster_radius_m = cluster_diameter_m / 2
-    cluster_area_m2 = math.pi * (cluster_radius_m ** 2)
+    # Same centre-to-centre shift for integer vertices (0 when not downsampled)
+    half_block = (scale - 1) // 2
+    
+    # Bounding boxes at working resolution (clusters crop their ROI from
+    # these; individual trees report them as their polygon)
+    bboxes = stats[kept_labels, :4]
+    
+    # 🔧 FIX: Flip Y-axis for Forma coordinate system
+    # Image coords: Y increases downward (top-left origin)
+    # Forma coords: Y increases upward (bottom-left origin)
+    centroids_m = np.empty(centroids_px.shape, dtype=np.float64)
+    np.multiply(centroids_px[:, 0], mx, out=centroids_m[:, 0])
+    np.subtract(height, centroids_px[:, 1], out=centroids_m[:, 1])
+    centroids_m[:, 1] *= my  # Use flipped Y for meters
+    
+    # Round everything reported to the client in NumPy, once, rather than
+    # calling round() per scalar; tolist() hands the loop plain Python values
+    centroids_px_list = centroids_px.tolist()
+    centroids_m_list = np.round(centroids_m, 2).tolist()
+    kept_is_cluster = is_cluster[kept_labels].tolist()
+    areas_m2_list = areas_m2.tolist()
+    areas_m2_rounded = np.round(areas_m2, 2).tolist()
+    diameters_m_rounded = np.round(diameters_m, 2).tolist()
     
     individual_trees = []
     tree_clusters = []
+    cluster_contours = []
     
-    for contour in contours:
-        area_pixels = cv2.contourArea(contour)
-        
-        # Skip tiny noise
-        if area_pixels < min_area_pixels:
-            continue
-        
-        # Convert to real-world area
-        area_m2 = area_pixels * meters_per_pixel_x * meters_per_pixel_y
-        
-        # Get centroid
-        M = cv2.moments(contour)
-        if M["m00"] == 0:
-            continue
-        
-        cx_px = int(M["m10"] / M["m00"])
-        cy_px = int(M["m01"] / M["m00"])
-        
-        # 🔧 FIX: Flip Y-axis for Forma coordinate system
-        # Image coords: Y increases downward (top-left origin)
-        # Forma coords: Y increases upward (bottom-left origin)
-        cy_px_flipped = height - cy_px
-        
-        cx_m = cx_px * meters_per_pixel_x
-        cy_m = cy_px_flipped * meters_per_pixel_y  # Use flipped Y for meters
+    for i, label in enumerate(kept_labels.tolist()):
+        x, y, w, h = bboxes[i].tolist()
         
-        # Get polygon points
-        polygon_px = contour.reshape(-1, 2).tolist()
-        # Flip Y-coordinate for each polygon point
-        polygon_m = [[p[0] * meters_per_pixel_x, (height - p[1]) * meters_per_pixel_y] for p in polygon_px]
-        
-        # Classify as individual tree or cluster
-        if area_m2 > cluster_area_m2:
-            # Tree cluster - populate with multiple trees
-            populated_trees = populate_cluster(
-                contour,
-                area_m2,
-                meters_per_pixel_x,
-                meters_per_pixel_y,
-                detection_params["min_diameter"],
-                detection_params["max_diameter"],
-                height
-            )
+        # Individual tree or cluster (classified above). Polygons are kept as
+        # NumPy arrays in full-resolution pixels; orjson serializes them
+        # directly, and meter coordinates are left to the client via
+        # metadata.pixelToMeter.
+        if kept_is_cluster[i]:
+            # Trace only this cluster's outline, on its tight bounding box
+            # cropped from the label map, instead of every blob in the image.
+            # TC89-KCOS keeps far fewer vertices than CHAIN_APPROX_SIMPLE on
+            # stair-stepped blob edges.
+            roi = (labels[y:y + h, x:x + w] == label).astype(np.uint8)
+            contours, _ = cv2.findContours(roi, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_TC89_KCOS, offset=(x, y))
+            contour = contours[0]
+            if scale > 1:
+                # Back to full-resolution pixel coordinates
+                contour = contour * scale + half_block
             
+            # Tree cluster - populated with multiple trees below
+            cluster_contours.append((contour, areas_m2_list[i]))
             tree_clusters.append({
                 "type": "cluster",
-                "areaM2": round(area_m2, 2),
-                "centroidPx": [cx_px, cy_px],
-                "centroidM": [round(cx_m, 2), round(cy_m, 2)],
-                "polygonPx": polygon_px,
-                "polygonM": [[round(p[0], 2), round(p[1], 2)] for p in polygon_m],
-                "populatedTrees": populated_trees
+                "areaM2": areas_m2_rounded[i],
+                "centroidPx": centroids_px_list[i],
+                "centroidM": centroids_m_list[i],
+                "polygonPx": contour.reshape(-1, 2),
+                "populatedTrees": []
             })
         else:
-            # Individual tree
-            estimated_diameter_m = 2 * math.sqrt(area_m2 / math.pi)
-            
-            # Only include if within size constraints
-            if detection_params["min_diameter"] <= estimated_diameter_m <= detection_params["max_diameter"]:
-                individual_trees.append({
-                    "type": "individual",
-                    "centroidPx": [cx_px, cy_px],
-                    "centroidM": [round(cx_m, 2), round(cy_m, 2)],
-                    "areaM2": round(area_m2, 2),
-                    "estimatedDiameterM": round(estimated_diameter_m, 2),
-                    "polygonPx": polygon_px,
-                    "polygonM": [[round(p[0], 2), round(p[1], 2)] for p in polygon_m]
-                })
+            # Individual tree (already within size constraints). Its centroid
+            # and diameter come straight from the component stats, so no
+            # contour is traced; the polygon is its bounding box, through the
+            # outermost pixel centres like the cluster contours.
+            x0, y0 = x * scale + half_block, y * scale + half_block
+            x1, y1 = (x + w - 1) * scale + half_block, (y + h - 1) * scale + half_block
+            individual_trees.append({
+                "type": "individual",
+                "centroidPx": centroids_px_list[i],
+                "centroidM": centroids_m_list[i],
+                "areaM2": areas_m2_rounded[i],
+                "estimatedDiameterM": diameters_m_rounded[i],
+                "polygonPx": [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+            })
+    
+    # Populate clusters in parallel on the shared pool: they share no state,
+    # each uses its own RNG, and the rasterization and numba kernel release
+    # the GIL. A couple of clusters aren't worth the hand-off.
+    populate_args = [
+        (
+            contour,
+            area_m2,
+            meters_per_pixel_x,
+            meters_per_pixel_y,
+            detection_params["min_diameter"],
+            detection_params["max_diameter"],
+            height
+        )
+        for contour, area_m2 in cluster_contours
+    ]
+    if len(populate_args) >= _MIN_PARALLEL_CLUSTERS and _CLUSTER_POOL_SIZE > 1:
+        populated = _CLUSTER_POOL.map(populate_cluster, *zip(*populate_args))
+    else:
+        populated = (populate_cluster(*args) for args in populate_args)
+    for cluster, trees in zip(tree_clusters, populated):
+        cluster["populatedTrees"] = trees
     
     # Calculate summary
     total_populated = sum(len(cluster["populatedTrees"]) for cluster in tree_clusters)
@@ -160,6 +384,14 @@ def detect_trees_in_image(
             "imageDimensionsPx": {"width": width, "height": height},
             "realDimensionsM": real_dimensions,
             "metersPerPixel": {"x": meters_per_pixel_x, "y": meters_per_pixel_y},
+            # Affine pixel -> Forma meter transform (includes the Y-flip):
+            # x_m = px * sx + tx, y_m = py * sy + ty
+            "pixelToMeter": {
+                "sx": meters_per_pixel_x,
+                "sy": -meters_per_pixel_y,
+                "tx": 0.0,
+                "ty": height * meters_per_pixel_y
+            },
             "hsvRange": {
                 "lower": lower_bound.tolist(),
                 "upper": upper_bound.tolist()
@@ -200,11 +432,14 @@ def populate_cluster(
     Returns:
         List of populated tree dictionaries
     """
-    populated_trees = []
-    
     # Get bounding box
     x, y, w, h = cv2.boundingRect(contour)
     
+    # Rasterize the contour once so inside tests are a single array lookup
+    # instead of walking every polygon edge per attempt
+    local_mask = np.zeros((h, w), np.uint8)
+    cv2.drawContours(local_mask, [contour - np.array([[x, y]])], -1, 255, thickness=cv2.FILLED)
+    
     # Estimate number of trees
     avg_tree_diameter = (min_diameter + max_diameter) / 2
     avg_tree_area = math.pi * (avg_tree_diameter / 2) ** 2
@@ -215,44 +450,158 @@ def populate_cluster(
     avg_meters_per_pixel = (meters_per_pixel_x + meters_per_pixel_y) / 2
     min_spacing_px = min_spacing_m / avg_meters_per_pixel
     
+    # Spatial hash grid cell size: at least the min spacing (so checking the
+    # 3×3 neighbouring cells is enough), and large enough that the grid has
+    # about one cell per expected tree rather than one per pixel
+    cell_size = max(min_spacing_px, 1.0, math.sqrt(w * h / estimated_tree_count))
+    
     # Use random sampling with spacing constraint
-    attempts = 0
     max_attempts = estimated_tree_count * 10
     
-    while len(populated_trees) < estimated_tree_count and attempts < max_attempts:
-        attempts += 1
-        
-        # Random point within bounding box
-        test_x = np.random.randint(x, x + w)
-        test_y = np.random.randint(y, y + h)
+    # Pre-generate random candidate points within the bounding box (and their
+    # diameters) in a few vectorized draws instead of one RNG call per attempt.
+    # SFC64 is a faster bit generator than the default PCG64, and a fresh
+    # Generator per call keeps clusters independent across threads.
+    rng = np.random.Generator(np.random.SFC64())
+    cand_x = rng.integers(x, x + w, size=max_attempts, dtype=np.int32)
+    cand_y = rng.integers(y, y + h, size=max_attempts, dtype=np.int32)
+    cand_d = rng.uniform(min_diameter, max_diameter, size=max_attempts)
+    
+    positions_px, diameters = _populate_kernel(
+        local_mask,
+        x,
+        y,
+        cand_x,
+        cand_y,
+        cand_d,
+        min_spacing_px,
+        cell_size,
+        estimated_tree_count
+    )
+    
+    # 🔧 FIX: Flip Y-axis for Forma coordinate system (same as main detection loop),
+    # converting and rounding all accepted positions at once
+    positions_m = np.empty(positions_px.shape, dtype=np.float64)
+    np.multiply(positions_px[:, 0], meters_per_pixel_x, out=positions_m[:, 0])
+    np.subtract(height, positions_px[:, 1], out=positions_m[:, 1])
+    positions_m[:, 1] *= meters_per_pixel_y
+    
+    positions_px_list = positions_px.tolist()
+    positions_m_list = np.round(positions_m, 2).tolist()
+    diameters_rounded = np.round(diameters, 2).tolist()
+    
+    return [
+        {
+            "positionPx": position_px,
+            "positionM": position_m,
+            "estimatedDiameterM": diameter_m
+        }
+        for position_px, position_m, diameter_m in zip(positions_px_list, positions_m_list, diameters_rounded)
+    ]
+
+
+def warm_up() -> None:
+    """
+    Compile (or load from numba's on-disk cache) the populate_cluster kernel.
+    
+    The first compilation takes seconds, so call this at image build time and
+    at worker startup rather than stalling the first clustered request. A
+    tiny square cluster goes through populate_cluster itself, so the kernel
+    is specialized for exactly the argument types real requests use.
+    """
+    square = np.array([[[0, 0]], [[15, 0]], [[15, 15]], [[0, 15]]], dtype=np.int32)
+    populate_cluster(square, 100.0, 1.0, 1.0, 2.0, 4.0, 16)
+
+
+@njit(cache=True, nogil=True)
+def _populate_kernel(
+    inside_mask: np.ndarray,
+    x_offset: int,
+    y_offset: int,
+    cand_x: np.ndarray,
+    cand_y: np.ndarray,
+    cand_d: np.ndarray,
+    min_spacing_px: float,
+    cell_size: float,
+    target_count: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compiled sampling loop for populate_cluster.
+    
+    Walks the pre-generated candidates in order and accepts those inside the
+    cluster mask that keep min_spacing_px from every accepted tree, until
+    target_count trees are placed or candidates run out. Accepted trees are
+    kept in a spatial hash grid of array-based linked lists (one head per
+    cell, one "next" per tree), so each spacing check only visits the 3×3
+    neighbouring cells. Compiled with nogil so clusters can be populated
+    from several threads at once.
+    
+    Args:
+        inside_mask: uint8 mask of the cluster, cropped to its bounding box
+        x_offset: Bounding box left edge in image pixels
+        y_offset: Bounding box top edge in image pixels
+        cand_x: Candidate X positions in image pixels
+        cand_y: Candidate Y positions in image pixels
+        cand_d: Candidate tree diameters in meters
+        min_spacing_px: Minimum distance between trees in pixels
+        cell_size: Grid cell size in pixels (>= min_spacing_px)
+        target_count: Number of trees to place
+    
+    Returns:
+        Tuple of (positions as (N, 2) int64 image pixels, diameters as (N,) float64)
+    """
+    h, w = inside_mask.shape
+    grid_w = int(w // cell_size) + 1
+    grid_h = int(h // cell_size) + 1
+    cell_head = np.full(grid_w * grid_h, -1, np.int64)
+    next_in_cell = np.empty(target_count, np.int64)
+    
+    positions = np.empty((target_count, 2), np.int64)
+    diameters = np.empty(target_count, np.float64)
+    min_spacing_sq = min_spacing_px * min_spacing_px
+    count = 0
+    
+    for attempt in range(cand_x.shape[0]):
+        if count >= target_count:
+            break
         
         # Check if point is inside contour
-        if cv2.pointPolygonTest(contour, (float(test_x), float(test_y)), False) < 0:
+        local_x = cand_x[attempt] - x_offset
+        local_y = cand_y[attempt] - y_offset
+        if inside_mask[local_y, local_x] == 0:
             continue
         
-        # Check minimum spacing from existing trees
+        # Check minimum spacing from existing trees in neighbouring cells
+        cell_x = int(local_x // cell_size)
+        cell_y = int(local_y // cell_size)
         too_close = False
-        for tree in populated_trees:
-            dist = math.sqrt(
-                (test_x - tree["positionPx"][0])**2 + 
-                (test_y - tree["positionPx"][1])**2
-            )
-            if dist < min_spacing_px:
-                too_close = True
+        for gy in range(max(cell_y - 1, 0), min(cell_y + 2, grid_h)):
+            for gx in range(max(cell_x - 1, 0), min(cell_x + 2, grid_w)):
+                j = cell_head[gy * grid_w + gx]
+                while j != -1:
+                    dx = local_x - positions[j, 0]
+                    dy = local_y - positions[j, 1]
+                    if dx * dx + dy * dy < min_spacing_sq:
+                        too_close = True
+                        break
+                    j = next_in_cell[j]
+                if too_close:
+                    break
+            if too_close:
                 break
         
         if too_close:
             continue
         
-        # 🔧 FIX: Flip Y-axis for Forma coordinate system (same as main detection loop)
-        test_y_flipped = height - test_y
-        position_m = [test_x * meters_per_pixel_x, test_y_flipped * meters_per_pixel_y]
-        diameter_m = np.random.uniform(min_diameter, max_diameter)
-        
-        populated_trees.append({
-            "positionPx": [int(test_x), int(test_y)],
-            "positionM": [round(position_m[0], 2), round(position_m[1], 2)],
-            "estimatedDiameterM": round(diameter_m, 2)
-        })
+        cell = cell_y * grid_w + cell_x
+        positions[count, 0] = local_x
+        positions[count, 1] = local_y
+        diameters[count] = cand_d[attempt]
+        next_in_cell[count] = cell_head[cell]
+        cell_head[cell] = count
+        count += 1
     
-    return populated_trees
+    positions = positions[:count]
+    positions[:, 0] += x_offset
+    positions[:, 1] += y_offset
+    return positions, diameters[:count]
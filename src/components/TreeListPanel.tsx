@@ -177,43 +177,28 @@ export function TreeListPanel({
         throw new Error(errorData.message || `HTTP ${response.status}: ${response.statusText}`);
       }
 
-      // Check if it's a JSON response (large model saved to Downloads) or OBJ content
-      const contentType = response.headers.get('content-type');
-      
-      if (contentType?.includes('application/json')) {
-        // Large model - already saved to Downloads folder
-        const data = await response.json();
-        console.log('✅ Large model saved to Downloads folder:', data);
-        alert(`✅ Large model generated!\n\n` +
-              `📁 Saved to: Downloads/${data.filename}\n` +
-              `📊 Trees: ${data.total_trees?.toLocaleString()}\n` +
-              `💾 Size: ${data.filesize_mb}MB\n\n` +
-              `⚠️ Warning: This is a large file. It may take time to open in 3D software.`);
-      } else {
-        // Normal model - download as blob
-        const objContent = await response.text();
-        console.log('✅ Model generated, size:', objContent.length, 'bytes');
+      // Download OBJ content as blob (kept as binary, so even very large
+      // models don't have to become one JS string)
+      const blob = await response.blob();
+      console.log('✅ Model generated, size:', blob.size, 'bytes');
 
-        // Create blob and download
-        const blob = new Blob([objContent], { type: 'model/obj' });
-        const url = URL.createObjectURL(blob);
-        const link = document.createElement('a');
-        link.href = url;
-        
-        // Generate filename with timestamp
-        const timestamp = new Date().toISOString().replace(/[:.]/g, '-').slice(0, -5);
-        link.download = `trees_model_${timestamp}.obj`;
-        
-        // Trigger download
-        document.body.appendChild(link);
-        link.click();
-        
-        // Cleanup
-        document.body.removeChild(link);
-        URL.revokeObjectURL(url);
-        
-        console.log('✅ OBJ file downloaded successfully');
-      }
+      const url = URL.createObjectURL(blob);
+      const link = document.createElement('a');
+      link.href = url;
+      
+      // Generate filename with timestamp
+      const timestamp = new Date().toISOString().replace(/[:.]/g, '-').slice(0, -5);
+      link.download = `trees_model_${timestamp}.obj`;
+      
+      // Trigger download
+      document.body.appendChild(link);
+      link.click();
+      
+      // Cleanup
+      document.body.removeChild(link);
+      URL.revokeObjectURL(url);
+      
+      console.log('✅ OBJ file downloaded successfully');
       
     } catch (error) {
       console.error('❌ OBJ download failed:', error);
@@ -32,11 +32,23 @@ export interface ImageDimensions {
 }
 
 /**
- * Tree polygon contour points in both pixel and meter coordinates
+ * Tree polygon points in pixel coordinates
+ * (cluster outline contour; bounding box for individual trees)
+ * Convert to meters with the result's metadata.pixelToMeter transform
  */
 export interface TreePolygon {
   polygonPx: number[][];   // [[x, y], [x, y], ...] in pixels
-  polygonM: number[][];    // [[x, y], [x, y], ...] in meters
+}
+
+/**
+ * Affine pixel -> meter transform (includes the image-to-Forma Y-flip)
+ * x_m = px * sx + tx,  y_m = py * sy + ty
+ */
+export interface PixelToMeterTransform {
+  sx: number;
+  sy: number;
+  tx: number;
+  ty: number;
 }
 
 /**
@@ -80,6 +92,7 @@ export interface TreeDetectionResult {
     imageDimensionsPx: { width: number; height: number };
     realDimensionsM: { width: number; height: number };
     metersPerPixel: { x: number; y: number };
+    pixelToMeter: PixelToMeterTransform;
     hsvRange: {
       lower: [number, number, number];   // [H, S, V]
       upper: [number, number, number];   // [H, S, V]